@@ -0,0 +1,91 @@
+# Long-lived interpreter that runs generated analysis scripts with the heavy libraries already imported.
+#
+# The server writes one JSON request per line to stdin: {"script": "<path>", "cwd": "<workspace>"}
+# and reads one JSON response per line from stdout: {"ok": bool, "stdout": str, "stderr": str}
+# Scripts never see the protocol pipes: their stdin is empty and their stdout is captured.
+#
+# Between runs the worker restores the working directory, environment variables, sys.path,
+# warnings filters, pandas options and matplotlib state. Modules a script imports stay in
+# sys.modules: extension modules such as numpy cannot be safely unloaded and re-imported, so
+# module-level state changed by a script (e.g. a patched library function) carries over to the next run.
+import contextlib
+import io
+import json
+import os
+import runpy
+import sys
+import traceback
+import warnings
+
+os.environ.setdefault("MPLBACKEND", "Agg")
+
+# Imported once so scripts find them in sys.modules instead of paying the import on every run
+import matplotlib.pyplot as plt # type: ignore
+import numpy # type: ignore # noqa: F401
+import pandas # type: ignore
+
+def script_traceback(tb):
+    """
+    Skip the worker and runpy frames so tracebacks read like a plain `python script.py` run.
+    """
+    while tb is not None:
+        file_name = tb.tb_frame.f_code.co_filename
+        if file_name not in (__file__, runpy.__file__) and not file_name.startswith('<frozen'):
+            break
+        tb = tb.tb_next
+    return tb
+
+def run_script(script_path: str, script_dir: str) -> dict:
+    """
+    Run a script as __main__ from script_dir and capture its output, returning the protocol response.
+    """
+    stdout, stderr = io.StringIO(), io.StringIO()
+    working_dir = os.getcwd()
+    environ = dict(os.environ)
+    path = list(sys.path)
+    ok = True
+    # A script that reads input gets EOF instead of consuming the next protocol request
+    sys.stdin = io.StringIO()
+    with contextlib.redirect_stdout(stdout), contextlib.redirect_stderr(stderr), warnings.catch_warnings():
+        try:
+            os.chdir(script_dir)
+            sys.argv = [script_path]
+            runpy.run_path(script_path, run_name="__main__")
+        except SystemExit as e:
+            ok = e.code in (None, 0)
+            if not ok and not isinstance(e.code, int):
+                print(e.code, file=sys.stderr)
+        except BaseException as e:
+            traceback.print_exception(type(e), e, script_traceback(e.__traceback__))
+            ok = False
+        finally:
+            # Leave no state behind for the next script
+            plt.close('all')
+            plt.rcdefaults()
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                pandas.reset_option("all")
+            os.environ.clear()
+            os.environ.update(environ)
+            sys.path[:] = path
+            os.chdir(working_dir)
+    return {"ok": ok, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+def main():
+    # Keep private handles on the protocol pipes, send anything written straight to fd 1 to stderr
+    # and point fd 0 at /dev/null, so neither scripts nor their subprocesses can touch the protocol
+    requests = os.fdopen(os.dup(sys.stdin.fileno()), 'r')
+    protocol = os.fdopen(os.dup(sys.stdout.fileno()), 'w')
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    devnull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devnull, sys.stdin.fileno())
+    os.close(devnull)
+
+    for line in requests:
+        request = json.loads(line)
+        response = run_script(request["script"], request["cwd"])
+        protocol.write(json.dumps(response) + "\n")
+        protocol.flush()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+# Exact-match cache for model responses, so a repeated request is answered without an API call
+import asyncio
+import contextlib
+import hashlib
+import logging
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import aiofiles # type: ignore
+import aiofiles.os # type: ignore
+import orjson
+
+logger = logging.getLogger(__name__)
+
+class LLMCache:
+    """
+    In-memory LRU cache of model responses keyed by the complete request, with entries expiring after a TTL.
+    With a directory, entries are also written to disk as JSON so they survive server restarts;
+    the directory is pruned to max_disk_entries files, dropping the oldest first, on the first write
+    and then every prune_interval writes, so it can briefly hold up to prune_interval - 1 extra files.
+    """
+    def __init__(self, max_entries: int, ttl: float, directory: Optional[str] = None, max_disk_entries: int = 256, prune_interval: int = 32):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.directory = directory
+        self.max_disk_entries = max_disk_entries
+        self.prune_interval = prune_interval
+        self.writes_until_prune = 0
+        self.entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    @staticmethod
+    def cache_key(model: str, messages: List[Dict[str, Any]], **kwargs) -> str:
+        """
+        Digest everything that shapes the response: the model, the messages and the request options.
+        """
+        payload = {"model": model, "messages": messages, "options": kwargs}
+        return hashlib.sha256(orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Return a cached value and mark it as recently used, or None on a miss or an expired entry.
+        """
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        stored_at, value = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: Any):
+        """
+        Store a value, evicting the least recently used entries beyond max_entries.
+        """
+        self.entries[key] = (time.monotonic(), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def entry_path(self, key: str) -> str:
+        """
+        Path of the on-disk copy of an entry.
+        """
+        return os.path.join(self.directory, f"{key}.json")
+
+    async def fetch(self, key: str) -> Optional[Any]:
+        """
+        Look a value up in memory, then on disk, keeping disk hits in memory for next time.
+        """
+        value = self.get(key)
+        if value is not None or not self.directory:
+            return value
+        path = self.entry_path(key)
+        try:
+            if time.time() - (await aiofiles.os.stat(path)).st_mtime > self.ttl:
+                await aiofiles.os.remove(path)
+                return None
+            async with aiofiles.open(path, 'rb') as f:
+                value = orjson.loads(await f.read())
+        except FileNotFoundError:
+            return None
+        except orjson.JSONDecodeError:
+            # Drop a corrupt entry so it is not read again
+            with contextlib.suppress(FileNotFoundError):
+                await aiofiles.os.remove(path)
+            return None
+        self.set(key, value)
+        return value
+
+    async def store(self, key: str, value: Any):
+        """
+        Store a value in memory and, with a directory, on disk.
+        The file is written under a unique temporary name and renamed so readers never see a partial entry;
+        a failed disk write only loses the on-disk copy.
+        """
+        self.set(key, value)
+        if not self.directory:
+            return
+        path = self.entry_path(key)
+        temp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            async with aiofiles.open(temp_path, 'wb') as f:
+                await f.write(orjson.dumps(value))
+            await aiofiles.os.replace(temp_path, path)
+            if self.writes_until_prune <= 0:
+                self.writes_until_prune = self.prune_interval
+                await asyncio.to_thread(self.prune_directory)
+            self.writes_until_prune -= 1
+        except OSError as e:
+            logger.warning(f"Could not write cache entry {key} to disk: {e}")
+            with contextlib.suppress(OSError):
+                await aiofiles.os.remove(temp_path)
+
+    def prune_directory(self):
+        """
+        Delete expired entry files and the oldest ones beyond max_disk_entries.
+        """
+        entries = []
+        with os.scandir(self.directory) as scan:
+            for entry in scan:
+                if not entry.name.endswith('.json'):
+                    continue
+                try:
+                    entries.append((entry.stat().st_mtime, entry.path))
+                except FileNotFoundError:
+                    continue
+        entries.sort(reverse=True)
+        now = time.time()
+        for index, (mtime, path) in enumerate(entries):
+            if index >= self.max_disk_entries or now - mtime > self.ttl:
+                with contextlib.suppress(FileNotFoundError):
+                    os.remove(path)
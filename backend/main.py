@@ -2,56 +2,184 @@
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect # type: ignore
 from fastapi.middleware.cors import CORSMiddleware # type: ignore
 from fastapi.staticfiles import StaticFiles # type: ignore
+import ast
 import json
+import mmap
 import asyncio
 import os
-import subprocess
-from typing import List, Dict, Any, Optional
+import py_compile
+import re
+import shutil
+import sys
+import time
+import uuid
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Callable, List, Dict, Any, Optional
+import aiofiles # type: ignore
+import aiofiles.os # type: ignore
+import httpx
+import ijson # type: ignore
 import openai
-from weasyprint import HTML # type: ignore
+import orjson
+import pandas as pd # type: ignore
+from openpyxl import load_workbook # type: ignore
+import pybase64 # type: ignore
 from dotenv import load_dotenv # type: ignore
+import jinja2 # type: ignore
 import logging
 import uvicorn # type: ignore
-import base64
-from elevenlabs.client import ElevenLabs # type: ignore
+import hashlib
+import itertools
+from collections import OrderedDict
+from elevenlabs.client import AsyncElevenLabs # type: ignore
+from llm_cache import LLMCache
+
+# Load environment variables before the configuration that reads them
+load_dotenv()
 
 # Configuration Constants
 OPENAI_MODEL = "gpt-4o-mini"
+# Render reports from the fixed template instead of having the model write them (USE_REPORT_TEMPLATE=1)
+USE_REPORT_TEMPLATE = os.getenv("USE_REPORT_TEMPLATE", "").lower() in ("1", "true", "yes")
 ELEVENLABS_VOICE_ID = "JBFqnCBsd6RMkjVDRZzb" 
 ELEVENLABS_MODEL_ID = "eleven_turbo_v2_5"
 ELEVENLABS_OUTPUT_FORMAT = "mp3_44100_128"
 MAX_RETRIES = 5
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = 20
+OPENAI_REQUEST_TIMEOUT = 45
+OPENAI_COMPLETION_TIMEOUT = 120
+OPENAI_MAX_ATTEMPTS = 4
+PDF_RENDER_WORKERS = os.cpu_count() or 1
+GENERATION_CACHE_SIZE = 32
+LLM_CACHE_TTL = 24 * 60 * 60
+LLM_CACHE_DISK_ENTRIES = 256
+ANALYSIS_WORKER_COUNT = 2
+ANALYSIS_WORKER_OUTPUT_LIMIT = 32 * 1024 * 1024
+ANALYSIS_SCRIPT_TIMEOUT = 300
+REPORT_FRAME_SIZE = 64 * 1024
+REPORT_PROMPT_MAX_ITEMS = 50
+CONTENT_BATCH_INTERVAL = 0.03
+CONTENT_BATCH_SIZE = 4096
+MAX_UPLOAD_BYTES = 512 * 1024 * 1024
+MAX_PENDING_CHUNKS = 16
+
+# How much of a JSON input the structure summary shows: nesting depth, keys per object, items per array
+JSON_SAMPLE_DEPTH = 3
+JSON_SAMPLE_KEYS = 5
+JSON_SAMPLE_ITEMS = 3
+JSON_INDENTS = ["  " * depth for depth in range(JSON_SAMPLE_DEPTH + 1)]
 
 # Directory Configuration
 TEMP_DIR = 'temp'
 INPUT_DIR = 'input'
 OUTPUT_DIR = 'output'
-REQUIRED_DIRS = [TEMP_DIR, INPUT_DIR, OUTPUT_DIR]
+LLM_CACHE_DIR = os.path.join(TEMP_DIR, 'llm_cache')
+# Each connection gets its own workspace here, holding its own input and output directories
+SESSIONS_DIR = os.path.join(TEMP_DIR, 'sessions')
+REQUIRED_DIRS = [TEMP_DIR, LLM_CACHE_DIR, SESSIONS_DIR]
+
+# Structured output for script fixes, so the code arrives as a JSON field instead of a fenced block
+ANALYSIS_SCRIPT_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "analysis_script",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"code": {"type": "string"}},
+            "required": ["code"],
+            "additionalProperties": False
+        }
+    }
+}
+
+# Imports the generated scripts most often forget, keyed by the name they bind
+COMMON_IMPORTS = {
+    "pd": "import pandas as pd",
+    "np": "import numpy as np",
+    "plt": "import matplotlib.pyplot as plt",
+    "json": "import json",
+    "os": "import os",
+    "re": "import re",
+    "math": "import math",
+    "time": "import time",
+    "warnings": "import warnings",
+}
+MISSING_NAME_PATTERN = re.compile(r"NameError: name '(\w+)' is not defined")
+ENCODING_COOKIE_PATTERN = re.compile(r'^[ \t\f]*#.*?coding[:=][ \t]*[-\w.]+')
+
+# Fenced code in model responses: extracted for execution and hidden from the streamed prose
+CODE_FENCE_LANGUAGES = ("python", "html")
+CODE_BLOCK_PATTERNS = {
+    language: re.compile(f"```{language}\n(.*?)```", re.DOTALL) for language in CODE_FENCE_LANGUAGES
+}
+
+# Relative PNG sources in the generated report, replaced with inline data URIs
+IMAGE_SRC_PATTERN = re.compile(r'src="([^"]+\.png)"')
 
 # File paths
-ANALYSIS_SCRIPT_PATH = os.path.join(TEMP_DIR, 'analysis_script.py')
+ANALYSIS_WORKER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'analysis_worker.py')
+TEMPLATES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'templates')
+# Paths inside a session workspace; scripts run with the workspace as their working directory
+ANALYSIS_SCRIPT_PATH = 'analysis_script.py'
 ANALYSIS_RESULTS_PATH = os.path.join(OUTPUT_DIR, 'analysis_results.json')
 REPORT_HTML_PATH = os.path.join(OUTPUT_DIR, 'report.html')
 REPORT_PDF_PATH = os.path.join(OUTPUT_DIR, 'report.pdf')
 
+# Traceback lines pointing into the analysis script (or its compiled .pyc)
+SCRIPT_ERROR_LINE_PATTERN = re.compile(rf'File "[^"]*{re.escape(os.path.basename(ANALYSIS_SCRIPT_PATH))}c?", line (\d+)')
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Load environment variables
-load_dotenv()
-
-# Initialize OpenAI client
-openai.api_key = os.getenv("OPENAI_API_KEY")
-
-# Initialize ElevenLabs
-elevenlabs_api_key = os.getenv("ELEVENLABS_API_KEY")
-if not elevenlabs_api_key:
-    logger.warning("ELEVENLABS_API_KEY not found in environment variables")
-elevenlabs_client = ElevenLabs(api_key=elevenlabs_api_key) if elevenlabs_api_key else None
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Create clients shared by all connections on startup and close them on shutdown.
+    """
+    # A single OpenAI client keeps its HTTP/2 connection pool alive across requests
+    openai_api_key = os.getenv("OPENAI_API_KEY")
+    if not openai_api_key:
+        logger.warning("OPENAI_API_KEY not found in environment variables")
+    app.state.openai = openai.AsyncOpenAI(
+        api_key=openai_api_key,
+        # Retries are handled with backoff in stream_openai_response
+        max_retries=0,
+        http_client=httpx.AsyncClient(
+            timeout=httpx.Timeout(60, connect=5),
+            http2=True,
+            limits=httpx.Limits(max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS)
+        )
+    ) if openai_api_key else None
+    # ElevenLabs gets its own keep-alive pool, reused for every spoken summary
+    elevenlabs_api_key = os.getenv("ELEVENLABS_API_KEY")
+    if not elevenlabs_api_key:
+        logger.warning("ELEVENLABS_API_KEY not found in environment variables")
+    elevenlabs_http_client = httpx.AsyncClient(timeout=httpx.Timeout(60, connect=5))
+    app.state.elevenlabs = AsyncElevenLabs(
+        api_key=elevenlabs_api_key,
+        httpx_client=elevenlabs_http_client
+    ) if elevenlabs_api_key else None
+    # WeasyPrint rendering is CPU-bound, so it runs in worker processes off the event loop.
+    # Every worker process warms itself up once as it starts.
+    app.state.pdf_pool = ProcessPoolExecutor(max_workers=PDF_RENDER_WORKERS, initializer=warm_pdf_worker)
+    # Analysis scripts run in persistent interpreters with pandas and matplotlib already imported
+    app.state.analysis_workers = AnalysisWorkerPool(ANALYSIS_WORKER_COUNT)
+    await app.state.analysis_workers.start()
+    try:
+        yield
+    finally:
+        if app.state.openai:
+            await app.state.openai.close()
+        await elevenlabs_http_client.aclose()
+        app.state.pdf_pool.shutdown(wait=False, cancel_futures=True)
+        await app.state.analysis_workers.close()
 
 # Create FastAPI app
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -67,10 +195,131 @@ for dir_path in REQUIRED_DIRS:
     if not os.path.exists(dir_path):
         os.makedirs(dir_path)
 
+async def send_json(websocket: WebSocket, message: dict):
+    """
+    Send a JSON text frame, serialized with orjson instead of Starlette's stdlib encoder.
+    """
+    await websocket.send_text(orjson.dumps(message).decode('utf-8'))
+
+def load_json(data: bytes) -> Any:
+    """
+    Parse JSON with orjson, falling back to the stdlib parser for the NaN/Infinity
+    literals that pandas-based analysis scripts commonly write.
+    """
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return json.loads(data)
+
+class CodeFenceFilter:
+    """
+    Split streamed model output into the prose shown to the user, hiding ```python and ```html blocks.
+    Fences are matched on whole lines, so a fence spread over several tokens is still recognized.
+    """
+    def __init__(self):
+        self.pending = ""
+        self.line_start = True
+        self.in_code = False
+
+    def feed(self, content: str, final: bool = False) -> str:
+        """
+        Add streamed content and return the prose that can be shown so far.
+        With final set, the last line is processed even without a trailing newline.
+        """
+        self.pending += content
+        shown = []
+        while self.pending:
+            newline = self.pending.find("\n")
+            if self.line_start and "```".startswith(self.pending[:3]):
+                # Possibly a fence: wait for the whole line before deciding
+                if newline == -1 and not final:
+                    break
+                line = self.pending if newline == -1 else self.pending[:newline + 1]
+                self.pending = self.pending[len(line):]
+                fence = line.strip()
+                if not self.in_code and fence[3:] in CODE_FENCE_LANGUAGES:
+                    self.in_code = True
+                    continue
+                if self.in_code and fence == "```":
+                    self.in_code = False
+                    shown.append("🔧 Generated code. Now preparing to execute...\n\n")
+                    continue
+            else:
+                line = self.pending if newline == -1 else self.pending[:newline + 1]
+                self.pending = self.pending[len(line):]
+            self.line_start = line.endswith("\n")
+            if not self.in_code:
+                shown.append(line)
+        return "".join(shown)
+
+class ContentBatcher:
+    """
+    Collect streamed prose and send it as one message per interval instead of one per token.
+    """
+    def __init__(self, websocket: Optional[WebSocket]):
+        self.websocket = websocket
+        self.parts: List[str] = []
+        self.size = 0
+        self.last_sent = time.monotonic()
+
+    async def add(self, text: str):
+        """
+        Queue text, sending the batch once it is large or old enough.
+        Call this for every streamed chunk, even hidden ones, so a batch is not held back while code streams.
+        """
+        if text:
+            self.parts.append(text)
+            self.size += len(text)
+        if self.parts and (self.size >= CONTENT_BATCH_SIZE or time.monotonic() - self.last_sent >= CONTENT_BATCH_INTERVAL):
+            await self.flush()
+
+    async def flush(self):
+        text = "".join(self.parts)
+        self.parts = []
+        self.size = 0
+        self.last_sent = time.monotonic()
+        if self.websocket and text.strip():
+            await send_json(self.websocket, {"content": text})
+
 # Helper Functions for OpenAI API calls
+async def create_chat_completion(messages: List[Dict[str, Any]], timeout: float, **kwargs) -> Any:
+    """
+    Call the chat completions API with a timeout, retrying transient failures with exponential backoff.
+    """
+    client: Optional[openai.AsyncOpenAI] = app.state.openai
+    if not client:
+        raise Exception("OpenAI client not initialized - missing API key")
+    for attempt in range(OPENAI_MAX_ATTEMPTS):
+        try:
+            return await asyncio.wait_for(
+                client.chat.completions.create(
+                    model=OPENAI_MODEL,
+                    messages=messages,
+                    **kwargs
+                ),
+                timeout=timeout
+            )
+        except (asyncio.TimeoutError, openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError) as e:
+            if attempt == OPENAI_MAX_ATTEMPTS - 1:
+                raise
+            delay = 2 ** attempt
+            logger.warning(f"OpenAI request failed ({type(e).__name__}), retrying in {delay}s")
+            await asyncio.sleep(delay)
+
+async def complete_openai_response(messages: List[Dict[str, Any]], **kwargs) -> str:
+    """
+    Request a complete response without streaming, for output that is never shown to the user.
+    """
+    logger.info("Making non-streaming API call to OpenAI")
+    # The timeout covers the whole generation here, not just the first byte of a stream
+    response = await create_chat_completion(messages, OPENAI_COMPLETION_TIMEOUT, **kwargs)
+    return response.choices[0].message.content or ""
+
 async def stream_openai_response(
     messages: List[Dict[str, Any]], 
     websocket: Optional[WebSocket] = None, 
+    cache: bool = False,
+    cache_check: Optional[Callable[[str], bool]] = None,
     **kwargs
 ) -> str:
     """
@@ -80,52 +329,55 @@ async def stream_openai_response(
     Args:
         messages: List of message dictionaries for the OpenAI chat completion
         websocket: Optional WebSocket to stream responses to
+        cache: Answer an identical earlier request from the response cache
+        cache_check: Only cache a completed response that this accepts, so an unusable one is not replayed
         **kwargs: Additional arguments to pass to the OpenAI API
         
     Returns:
         str: The complete response from OpenAI
     """
+    cache_key = LLMCache.cache_key(OPENAI_MODEL, messages, **kwargs) if cache else None
+    cached = await llm_cache.fetch(cache_key) if cache_key else None
+    if cached is not None:
+        logger.info("Reusing cached OpenAI response")
+        # Replay what the user saw the first time in one message instead of token by token
+        if websocket and cached["preview"].strip():
+            await send_json(websocket, {"content": cached["preview"]})
+        return cached["response"]
+
     logger.info("Making API call to OpenAI")
-    client = openai.OpenAI()
-    stream = client.chat.completions.create(
-        model=OPENAI_MODEL,
-        messages=messages,
-        stream=True,
-        **kwargs
-    )
+    stream = await create_chat_completion(messages, OPENAI_REQUEST_TIMEOUT, stream=True, **kwargs)
     
     logger.info("Stream object created, beginning to process chunks")
-    full_response = ""
-    code_section = False
-    current_section = ""
+    response_parts: List[str] = []
+    preview_parts: List[str] = []
+    fence_filter = CodeFenceFilter()
+    batcher = ContentBatcher(websocket)
+    finish_reason = None
     
-    for chunk in stream:
+    async for chunk in stream:
+        if chunk and chunk.choices and chunk.choices[0].finish_reason:
+            finish_reason = chunk.choices[0].finish_reason
         if chunk and chunk.choices and chunk.choices[0].delta.content:
             content = chunk.choices[0].delta.content
-            full_response += content
-            
-            # Check if we're entering or leaving a code block
-            if "```" in content:
-                if any(lang in content for lang in ["```python", "```html"]):
-                    code_section = True
-                    current_section = content[content.find("```"):] + "\n"
-                    continue
-                elif code_section:
-                    code_section = False
-                    if current_section and websocket:
-                        await websocket.send_json({
-                            "content": "🔧 Generated code. Now preparing to execute...\n\n"
-                        })
-                    current_section = ""
-                    continue
+            response_parts.append(content)
             
-            if code_section:
-                current_section += content
-            elif websocket and content.strip():
-                await websocket.send_json({"content": content})
+            # Only prose is streamed to the user; code blocks are replaced by a short notice
+            shown = fence_filter.feed(content)
+            preview_parts.append(shown)
+            await batcher.add(shown)
+    
+    shown = fence_filter.feed("", final=True)
+    preview_parts.append(shown)
+    await batcher.add(shown)
+    await batcher.flush()
     
     logger.info("Received complete response from OpenAI")
-    return full_response
+    response = "".join(response_parts)
+    # A truncated or unusable response would otherwise be replayed for every identical request
+    if cache_key and finish_reason == "stop" and (cache_check is None or cache_check(response)):
+        await llm_cache.store(cache_key, {"response": response, "preview": "".join(preview_parts)})
+    return response
 
 def extract_code_from_response(response: str, language: str = "python") -> str:
     """
@@ -141,121 +393,376 @@ def extract_code_from_response(response: str, language: str = "python") -> str:
     Raises:
         Exception: If no code block is found for the specified language
     """
-    import re
-    pattern = f"```{language}\n(.*?)```"
-    code_match = re.search(pattern, response, re.DOTALL)
+    code_match = CODE_BLOCK_PATTERNS[language].search(response)
     if not code_match:
         raise Exception(f"No {language} code block found in the response")
     return code_match.group(1).strip()
 
+class AnalysisWorkspace:
+    """
+    Private directory for one connection's uploads, script, results and reports, so concurrent
+    analyses never read or overwrite each other's files.
+    """
+    def __init__(self):
+        self.root = os.path.abspath(os.path.join(SESSIONS_DIR, uuid.uuid4().hex))
+        self.input_dir = os.path.join(self.root, INPUT_DIR)
+        self.output_dir = os.path.join(self.root, OUTPUT_DIR)
+        os.makedirs(self.input_dir)
+        os.makedirs(self.output_dir)
+
+    def path(self, relative_path: str) -> str:
+        return os.path.join(self.root, relative_path)
+
+    def remove(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
 # Connection manager for handling WebSocket connections
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        # Weak references, so a socket that is never explicitly disconnected doesn't stay alive here
+        self.active_connections: weakref.WeakSet[WebSocket] = weakref.WeakSet()
 
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
-        self.active_connections.append(websocket)
+        self.active_connections.add(websocket)
 
     def disconnect(self, websocket: WebSocket):
-        if websocket in self.active_connections:
-            self.active_connections.remove(websocket)
+        self.active_connections.discard(websocket)
 
     async def send_message(self, websocket: WebSocket, message: dict):
         if websocket in self.active_connections:
             try:
-                await websocket.send_json(message)
+                await send_json(websocket, message)
             except RuntimeError:
                 self.disconnect(websocket)
 
+    async def broadcast(self, message: dict):
+        # Snapshot the connections so disconnects during the send don't mutate the list being iterated
+        connections = list(self.active_connections)
+        results = await asyncio.gather(
+            *(send_json(websocket, message) for websocket in connections),
+            return_exceptions=True
+        )
+        for websocket, result in zip(connections, results):
+            if isinstance(result, Exception):
+                self.disconnect(websocket)
+
 # Instantiate the connection manager
 manager = ConnectionManager()
 
-async def analyze_file_structure(file_name: str, file_path: str) -> tuple[str, dict]:
+# Persistent interpreters for running the generated analysis scripts
+class AnalysisWorker:
+    def __init__(self):
+        self.process: Optional[asyncio.subprocess.Process] = None
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, ANALYSIS_WORKER_PATH,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            limit=ANALYSIS_WORKER_OUTPUT_LIMIT
+        )
+
+    def kill(self):
+        """
+        Kill the worker process; the next run starts a fresh one.
+        """
+        if self.process and self.process.returncode is None:
+            self.process.kill()
+        self.process = None
+
+    async def restart(self):
+        process = self.process
+        self.kill()
+        if process:
+            await process.wait()
+        await self.start()
+
+    async def exchange(self, script_path: str, working_dir: str) -> bytes:
+        self.process.stdin.write(orjson.dumps({"script": script_path, "cwd": working_dir}) + b"\n")
+        await self.process.stdin.drain()
+        return await self.process.stdout.readline()
+
+    async def run(self, script_path: str, working_dir: str) -> tuple[bool, str, str]:
+        """
+        Run a script in the worker from working_dir and return (success, stdout, stderr).
+        The worker is restarted if it is not running, e.g. after a script crashed the interpreter.
+        A run that fails partway leaves a response in flight on the pipe, so the worker is replaced
+        rather than reused: otherwise the next script would read the previous script's response.
+        """
+        if self.process is None or self.process.returncode is not None:
+            await self.start()
+        try:
+            response = await asyncio.wait_for(self.exchange(script_path, working_dir), ANALYSIS_SCRIPT_TIMEOUT)
+            if not response:
+                return_code = await self.process.wait()
+                return False, "", f"Analysis worker exited with code {return_code}"
+            result = orjson.loads(response)
+        except TimeoutError:
+            await self.restart()
+            return False, "", f"Analysis script did not finish within {ANALYSIS_SCRIPT_TIMEOUT} seconds"
+        except orjson.JSONDecodeError:
+            await self.restart()
+            return False, "", "Analysis worker returned an unreadable response"
+        except ValueError:
+            # Raised by readline when the response is larger than the stream limit
+            await self.restart()
+            return False, "", f"Analysis script output exceeded {ANALYSIS_WORKER_OUTPUT_LIMIT // (1024 * 1024)} MB"
+        except BaseException:
+            # Cancelled or broken mid-run: the worker may still be busy, so it cannot be reused
+            self.kill()
+            raise
+        return result["ok"], result["stdout"], result["stderr"]
+
+    async def close(self):
+        if self.process and self.process.returncode is None:
+            self.process.stdin.close()
+            await self.process.wait()
+
+class AnalysisWorkerPool:
+    def __init__(self, size: int):
+        self.workers = [AnalysisWorker() for _ in range(size)]
+        self.idle_workers: asyncio.Queue[AnalysisWorker] = asyncio.Queue()
+
+    async def start(self):
+        for worker in self.workers:
+            await worker.start()
+            self.idle_workers.put_nowait(worker)
+
+    async def run(self, script_path: str, working_dir: str) -> tuple[bool, str, str]:
+        worker = await self.idle_workers.get()
+        # A worker whose run failed has already replaced (or killed) its process, so it is safe to hand out again
+        try:
+            return await worker.run(script_path, working_dir)
+        finally:
+            self.idle_workers.put_nowait(worker)
+
+    async def close(self):
+        await asyncio.gather(*(worker.close() for worker in self.workers))
+
+# Generation responses keyed by the full request, shared by all connections and kept on disk across restarts
+llm_cache = LLMCache(GENERATION_CACHE_SIZE, LLM_CACHE_TTL, LLM_CACHE_DIR, LLM_CACHE_DISK_ENTRIES)
+
+# Working analysis scripts keyed by a digest of the input files and prompt
+analysis_code_cache: OrderedDict[str, str] = OrderedDict()
+
+def get_cached(cache: OrderedDict, key: Any) -> Optional[Any]:
+    """
+    Return a cached value and mark it as recently used, or None on a miss.
+    Safe to call from worker threads: an entry evicted concurrently is just a miss.
+    """
+    try:
+        cache.move_to_end(key)
+    except KeyError:
+        return None
+    return cache.get(key)
+
+def set_cached(cache: OrderedDict, key: Any, value: Any):
+    """
+    Store a value, evicting the least recently used entries beyond GENERATION_CACHE_SIZE.
+    """
+    cache[key] = value
+    try:
+        cache.move_to_end(key)
+        while len(cache) > GENERATION_CACHE_SIZE:
+            cache.popitem(last=False)
+    except KeyError:
+        # Another thread evicted the same entries first
+        pass
+
+def analysis_cache_key(file_digests: Dict[str, bytes], analysis_prompt: str) -> str:
+    """
+    Digest the analysis prompt together with the name and content digest of every input file.
+    """
+    key = hashlib.blake2b(analysis_prompt.encode())
+    for file_name, digest in file_digests.items():
+        key.update(file_name.encode())
+        key.update(digest)
+    return key.hexdigest()
+
+# Structure descriptions keyed by (file_path, mtime_ns, size) so unchanged files are not re-read
+file_structure_cache: OrderedDict[tuple, tuple[str, dict]] = OrderedDict()
+
+def count_csv_rows(file_path: str) -> int:
+    """
+    Count the data rows of a CSV file by scanning for newlines instead of parsing it.
+    """
+    newlines = 0
+    last_byte = b'\n'
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            newlines += block.count(b'\n')
+            last_byte = block[-1:]
+    if last_byte != b'\n':
+        newlines += 1
+    # Exclude the header line
+    return max(newlines - 1, 0)
+
+def count_excel_rows(file_path: str) -> int:
+    """
+    Count the data rows of the first worksheet without loading the workbook into pandas.
+    """
+    workbook = load_workbook(file_path, read_only=True)
+    try:
+        worksheet = workbook.worksheets[0]
+        total_rows = worksheet.max_row or sum(1 for _ in worksheet.iter_rows(values_only=True))
+    finally:
+        workbook.close()
+    # Exclude the header row
+    return max(total_rows - 1, 0)
+
+def skip_json_value(events, event: str):
+    """
+    Consume the parser events of a value without building it.
+    """
+    if event not in ('start_map', 'start_array'):
+        return
+    depth = 1
+    for _, event, _ in events:
+        if event in ('start_map', 'start_array'):
+            depth += 1
+        elif event in ('end_map', 'end_array'):
+            depth -= 1
+            if depth == 0:
+                return
+
+def sample_json_value(events, event: str, value: Any, depth: int = 0) -> tuple[Any, int]:
+    """
+    Rebuild a JSON value from ijson parser events, keeping only what the structure summary shows:
+    one key or item beyond the limit (so the summary knows there are more) and empty placeholders
+    below the depth limit.
+    Returns a tuple of (sampled_value, number_of_keys_or_items)
+    """
+    if event == 'start_map':
+        sample, limit, end = {}, JSON_SAMPLE_KEYS, 'end_map'
+    elif event == 'start_array':
+        sample, limit, end = [], JSON_SAMPLE_ITEMS, 'end_array'
+    else:
+        return value, 1
+
+    count = 0
+    for _, event, value in events:
+        if event == end:
+            break
+        if event == 'map_key':
+            key = value
+            _, event, value = next(events)
+        is_container = event in ('start_map', 'start_array')
+        if count < limit and is_container and depth + 1 < JSON_SAMPLE_DEPTH:
+            item, _ = sample_json_value(events, event, value, depth + 1)
+        else:
+            skip_json_value(events, event)
+            item = ({} if event == 'start_map' else []) if is_container else value
+        if count <= limit:
+            if isinstance(sample, dict):
+                sample[key] = item
+            else:
+                sample.append(item)
+        count += 1
+    return sample, count
+
+def read_json_sample(file_path: str) -> tuple[Any, int]:
+    """
+    Parse a JSON file incrementally, so memory stays bounded by the sample instead of the file size.
+    Returns a tuple of (sampled_value, top_level_items)
+    """
+    with open(file_path, 'rb') as f:
+        events = ijson.parse(f, use_float=True)
+        _, event, value = next(events)
+        return sample_json_value(events, event, value)
+
+# Sample reader and row counter for each tabular file extension
+TABULAR_READERS = {
+    'csv': (pd.read_csv, count_csv_rows),
+    'txt': (pd.read_csv, count_csv_rows),
+    'xlsx': (pd.read_excel, count_excel_rows),
+}
+
+def analyze_file_structure(file_name: str, file_path: str) -> tuple[str, dict]:
     """
     Analyze the structure of a file based on its type.
     Returns a tuple of (structure_description, metadata)
+    Reads the file synchronously, so call it from a worker thread.
     """
     file_extension = file_name.lower().split('.')[-1]
     
     try:
-        if file_extension in ['csv', 'txt']:
-            import pandas as pd
-            df = pd.read_csv(file_path)
-            structure = f"\nFile: {file_name}\nColumns: {', '.join(df.columns)}\nFirst three rows:\n{df.head(3).to_string()}\n"
-            metadata = {
-                "type": "tabular",
-                "rows": len(df),
-                "columns": len(df.columns)
-            }
-            return structure, metadata
-            
-        elif file_extension == 'xlsx':
-            import pandas as pd
-            df = pd.read_excel(file_path)
-            structure = f"\nFile: {file_name}\nColumns: {', '.join(df.columns)}\nFirst three rows:\n{df.head(3).to_string()}\n"
+        stat = os.stat(file_path)
+        cache_key = (file_path, stat.st_mtime_ns, stat.st_size)
+        cached = get_cached(file_structure_cache, cache_key)
+        if cached is not None:
+            return cached
+
+        if file_extension in TABULAR_READERS:
+            read_sample, count_rows = TABULAR_READERS[file_extension]
+            # Only the header and a few sample rows are needed for the prompt
+            df = read_sample(file_path, nrows=3)
+            structure = f"\nFile: {file_name}\nColumns: {', '.join(map(str, df.columns))}\nFirst three rows:\n{df.to_string()}\n"
             metadata = {
                 "type": "tabular",
-                "rows": len(df),
+                "rows": count_rows(file_path),
                 "columns": len(df.columns)
             }
+            set_cached(file_structure_cache, cache_key, (structure, metadata))
             return structure, metadata
             
         elif file_extension == 'json':
-            import json
-            with open(file_path, 'r') as f:
-                data = json.load(f)
+            try:
+                data, top_level_items = read_json_sample(file_path)
+            except ijson.JSONError:
+                # ijson rejects the NaN/Infinity literals the stdlib parser accepts
+                with open(file_path, 'rb') as f:
+                    data = load_json(f.read())
+                top_level_items = len(data) if isinstance(data, (dict, list)) else 1
             
-            def analyze_json_structure(obj, max_depth=3, current_depth=0):
+            def analyze_json_structure(obj, parts, max_depth=JSON_SAMPLE_DEPTH, current_depth=0):
+                # Fragments are collected in parts and joined once by the caller
                 if current_depth >= max_depth:
-                    return "..."
+                    parts.append("...")
+                    return parts
+                indent = JSON_INDENTS[current_depth]
+                child_indent = JSON_INDENTS[current_depth + 1]
                 
                 if isinstance(obj, dict):
-                    structure = "{\n"
-                    for key, value in list(obj.items())[:5]:  # Limit to first 5 keys
-                        structure += "  " * (current_depth + 1)
-                        structure += f'"{key}": '
+                    parts.append("{\n")
+                    for key, value in list(obj.items())[:JSON_SAMPLE_KEYS]:
+                        parts.append(f'{child_indent}"{key}": ')
                         if isinstance(value, (dict, list)):
-                            structure += analyze_json_structure(value, max_depth, current_depth + 1)
+                            analyze_json_structure(value, parts, max_depth, current_depth + 1)
                         else:
-                            structure += f"{type(value).__name__}"
-                        structure += ",\n"
-                    if len(obj) > 5:
-                        structure += "  " * (current_depth + 1) + "...\n"
-                    structure += "  " * current_depth + "}"
-                    return structure
+                            parts.append(type(value).__name__)
+                        parts.append(",\n")
+                    if len(obj) > JSON_SAMPLE_KEYS:
+                        parts.append(f"{child_indent}...\n")
+                    parts.append(f"{indent}}}")
                 
                 elif isinstance(obj, list):
                     if not obj:
-                        return "[]"
-                    structure = "[\n"
-                    for item in obj[:3]:  # Limit to first 3 items
-                        structure += "  " * (current_depth + 1)
+                        parts.append("[]")
+                        return parts
+                    parts.append("[\n")
+                    for item in obj[:JSON_SAMPLE_ITEMS]:
+                        parts.append(child_indent)
                         if isinstance(item, (dict, list)):
-                            structure += analyze_json_structure(item, max_depth, current_depth + 1)
+                            analyze_json_structure(item, parts, max_depth, current_depth + 1)
                         else:
-                            structure += f"{type(item).__name__}"
-                        structure += ",\n"
-                    if len(obj) > 3:
-                        structure += "  " * (current_depth + 1) + "...\n"
-                    structure += "  " * current_depth + "]"
-                    return structure
+                            parts.append(type(item).__name__)
+                        parts.append(",\n")
+                    if len(obj) > JSON_SAMPLE_ITEMS:
+                        parts.append(f"{child_indent}...\n")
+                    parts.append(f"{indent}]")
                 
-                return str(type(obj).__name__)
+                else:
+                    parts.append(type(obj).__name__)
+                return parts
             
-            structure = f"\nFile: {file_name}\nStructure:\n{analyze_json_structure(data)}\n"
-            
-            def count_items(obj):
-                if isinstance(obj, dict):
-                    return len(obj)
-                elif isinstance(obj, list):
-                    return len(obj)
-                return 1
+            structure = f"\nFile: {file_name}\nStructure:\n{''.join(analyze_json_structure(data, []))}\n"
             
             metadata = {
                 "type": "json",
-                "top_level_items": count_items(data)
+                "top_level_items": top_level_items
             }
+            set_cached(file_structure_cache, cache_key, (structure, metadata))
             return structure, metadata
             
         else:
@@ -267,44 +774,26 @@ async def analyze_file_structure(file_name: str, file_path: str) -> tuple[str, d
         logger.warning(f"Could not read structure for {file_name}: {str(e)}")
         return f"\nFile: {file_name}\nStructure could not be read: {str(e)}\n", {"type": "error"}
 
-# Generate Python code for data analysis using OpenAI API
-async def generate_analysis_code(file_names: List[str], analysis_prompt: str, websocket: WebSocket) -> str:
+async def read_file_structures(file_names: List[str], input_dir: str) -> tuple[List[str], Dict[str, dict]]:
     """
-    Generate Python code for data analysis using OpenAI API.
+    Describe every input file, returning the structure texts in order and the metadata by file name.
     """
-    logger.info(f"Starting code generation for files: {', '.join(file_names)}")
-    logger.info(f"Analysis prompt: {analysis_prompt}")
-
-    await websocket.send_json({"content": "🔍 Analyzing your files and preparing the data analysis strategy...\n\n"})
-
-    # Read file structures
-    file_structures = []
-    file_metadata = {}
-    
-    for file_name in file_names:
-        file_path = os.path.join(INPUT_DIR, file_name)
-        structure, metadata = await analyze_file_structure(file_name, file_path)
-        file_structures.append(structure)
-        file_metadata[file_name] = metadata
-        
-        if metadata["type"] == "tabular":
-            await websocket.send_json({
-                "content": f"📊 Analyzed {file_name}:\n- Found {metadata['columns']} columns\n- {metadata['rows']:,} rows of data\n\n"
-            })
-        elif metadata["type"] == "json":
-            await websocket.send_json({
-                "content": f"🔍 Analyzed {file_name}:\n- JSON data with {metadata['top_level_items']} top-level items\n\n"
-            })
-        elif metadata["type"] == "error":
-            await websocket.send_json({
-                "content": f"⚠️ Could not analyze {file_name}: {structure}\n\n"
-            })
-
-    await websocket.send_json({
-        "content": "🤖 Now I'll write a Python script to analyze your data based on your requirements...\n\n"
-    })
-
-    messages = [{
+    # The pandas and JSON reads block, so the files are read concurrently in worker threads
+    results = await asyncio.gather(*(
+        asyncio.to_thread(analyze_file_structure, file_name, os.path.join(input_dir, file_name))
+        for file_name in file_names
+    ))
+    file_structures = [structure for structure, _ in results]
+    file_metadata = {file_name: metadata for file_name, (_, metadata) in zip(file_names, results)}
+    return file_structures, file_metadata
+
+# Build the analysis prompt. Retries reuse these messages unchanged as their prefix, so
+# OpenAI's prompt cache can serve them instead of reprocessing the file structures.
+def build_analysis_messages(file_names: List[str], analysis_prompt: str, file_structures: List[str], file_metadata: Dict[str, dict]) -> List[Dict[str, str]]:
+    """
+    Build the system and user messages asking for the analysis script.
+    """
+    return [{
         "role": "system",
         "content": """You are a data analysis assistant with expertise in Python, pandas, matplotlib, and JSON data processing. 
 Write clean, efficient Python code that produces insightful analysis and clear visualizations."""
@@ -398,11 +887,47 @@ Do not handle errors in the code, we will deal with them in the iteration proces
 """
     }]
 
+# Generate Python code for data analysis using OpenAI API
+async def generate_analysis_code(file_names: List[str], analysis_prompt: str, workspace: AnalysisWorkspace, websocket: WebSocket) -> str:
+    """
+    Generate Python code for data analysis using OpenAI API.
+    """
+    logger.info(f"Starting code generation for files: {', '.join(file_names)}")
+    logger.info(f"Analysis prompt: {analysis_prompt}")
+
+    await send_json(websocket, {"content": "🔍 Analyzing your files and preparing the data analysis strategy...\n\n"})
+
+    file_structures, file_metadata = await read_file_structures(file_names, workspace.input_dir)
+
+    for file_name, structure in zip(file_names, file_structures):
+        metadata = file_metadata[file_name]
+        if metadata["type"] == "tabular":
+            await send_json(websocket, {
+                "content": f"📊 Analyzed {file_name}:\n- Found {metadata['columns']} columns\n- {metadata['rows']:,} rows of data\n\n"
+            })
+        elif metadata["type"] == "json":
+            await send_json(websocket, {
+                "content": f"🔍 Analyzed {file_name}:\n- JSON data with {metadata['top_level_items']} top-level items\n\n"
+            })
+        elif metadata["type"] == "error":
+            await send_json(websocket, {
+                "content": f"⚠️ Could not analyze {file_name}: {structure}\n\n"
+            })
+
+    await send_json(websocket, {
+        "content": "🤖 Now I'll write a Python script to analyze your data based on your requirements...\n\n"
+    })
+
+    messages = build_analysis_messages(file_names, analysis_prompt, file_structures, file_metadata)
+
     try:
-        full_response = await stream_openai_response(messages, websocket)
+        full_response = await stream_openai_response(
+            messages, websocket, cache=True,
+            cache_check=lambda response: CODE_BLOCK_PATTERNS["python"].search(response) is not None
+        )
         code = extract_code_from_response(full_response)
         logger.info("Successfully extracted Python code from response")
-        await websocket.send_json({
+        await send_json(websocket, {
             "content": "✨ Analysis code is ready! Starting the execution phase...\n\n"
         })
         return code
@@ -410,83 +935,163 @@ Do not handle errors in the code, we will deal with them in the iteration proces
         logger.error(f"Failed to generate analysis code: {str(e)}", exc_info=True)
         raise
 
-async def iterate_analysis_script(file_names: List[str], analysis_prompt: str, current_script: str, error_message: str, websocket: WebSocket) -> tuple[str, bool]:
+def failing_line_number(error_message: str) -> Optional[int]:
     """
-    Iteratively improve the analysis script based on execution errors.
-    Returns a tuple of (new_script, success) where success indicates if execution was successful.
+    Return the last script line the traceback points at, or None if it names none.
     """
-    logger.info("Starting script iteration with error: %s", error_message)
-    
-    messages = [{
-        "role": "system",
-        "content": "You are a Python code debugging assistant. Fix the provided code based on the error message while maintaining the original analysis goals."
-    }, {
-        "role": "user",
-        "content": f"""The following Python script failed to execute properly:
+    line_numbers = SCRIPT_ERROR_LINE_PATTERN.findall(error_message)
+    return int(line_numbers[-1]) if line_numbers else None
 
-```python
-{current_script}
-```
+def add_missing_import(script: str, error_message: str) -> Optional[str]:
+    """
+    Fix a NameError on a conventional module alias by adding its import, without a model round trip.
+    Returns None when the error is anything else.
+    """
+    match = MISSING_NAME_PATTERN.search(error_message)
+    if not match or match.group(1) not in COMMON_IMPORTS:
+        return None
+    lines = script.splitlines(keepends=True)
+    insert_at = import_insertion_line(script, lines)
+    if insert_at == len(lines) and lines and not lines[-1].endswith('\n'):
+        lines[-1] += '\n'
+    lines.insert(insert_at, f"{COMMON_IMPORTS[match.group(1)]}\n")
+    return "".join(lines)
+
+def import_insertion_line(script: str, lines: List[str]) -> int:
+    """
+    Return the index of the first line after the shebang, encoding cookie, module docstring
+    and __future__ imports, where an added import leaves all of them in a valid position.
+    """
+    insert_at = 0
+    for index, line in enumerate(lines[:2]):
+        if (index == 0 and line.startswith('#!')) or ENCODING_COOKIE_PATTERN.match(line):
+            insert_at = index + 1
+    try:
+        body = ast.parse(script).body
+    except SyntaxError:
+        return insert_at
+    for position, node in enumerate(body):
+        is_docstring = (
+            position == 0 and isinstance(node, ast.Expr)
+            and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)
+        )
+        if not is_docstring and not (isinstance(node, ast.ImportFrom) and node.module == '__future__'):
+            break
+        insert_at = max(insert_at, node.end_lineno)
+    return insert_at
 
-The error message was:
-{error_message}
+async def request_script_fix(file_names: List[str], analysis_prompt: str, current_script: str, error_message: str, workspace: AnalysisWorkspace) -> str:
+    """
+    Ask the model for a fixed version of a failing analysis script.
+    """
+    # Same prefix as the generation request so the cached prompt is reused; only the failure is new
+    file_structures, file_metadata = await read_file_structures(file_names, workspace.input_dir)
+    messages = build_analysis_messages(file_names, analysis_prompt, file_structures, file_metadata)
+    messages.append({"role": "assistant", "content": f"```python\n{current_script}\n```"})
 
-The script should analyze these files from the 'input' directory: {', '.join(file_names)}
-With this analysis focus: {analysis_prompt}
+    # The script is already in the conversation, so point at the failing line rather than repeating it
+    error_line = failing_line_number(error_message)
+    error_context = f"\nThe error is raised at line {error_line} of the script above.\n" if error_line else ""
 
+    messages.append({
+        "role": "user",
+        "content": f"""Running this script failed with:
+{error_message}
+{error_context}
 Please provide a fixed version of the script that:
 1. Addresses the error
 2. Maintains the original analysis goals
-3. Ensures proper error handling
-4. Validates data before processing
-5. Properly saves results to '{ANALYSIS_RESULTS_PATH}'
-6. if the error is ModuleNotFoundError, rewrite to only use libraries like pandas, matplotlib, json, os, numpy, etc.
+3. Validates data before processing
+4. Properly saves results to '{ANALYSIS_RESULTS_PATH}'
+5. if the error is ModuleNotFoundError, rewrite to only use libraries like pandas, matplotlib, json, os, numpy, etc.
 
-Do not use any try except blocks - we will deal with errors in another way.
-Do not handle errors in the code, we will deal with them in the iteration process.
+Output JSON with the complete fixed script in the field `code`.
 """
-    }]
+    })
+
+    # The fix is not shown to the user, so request bare JSON in one response instead of a stream
+    full_response = await complete_openai_response(
+        messages,
+        response_format=ANALYSIS_SCRIPT_RESPONSE_FORMAT
+    )
+    return orjson.loads(full_response)["code"].strip()
 
+async def run_analysis_candidate(script: str, workspace: AnalysisWorkspace, websocket: WebSocket) -> Optional[str]:
+    """
+    Save and execute a candidate script.
+    Returns None if it produced the analysis results, otherwise the error to fix.
+    """
+    script_path = workspace.path(ANALYSIS_SCRIPT_PATH)
+    async with aiofiles.open(script_path, 'w') as f:
+        await f.write(script)
     try:
-        full_response = await stream_openai_response(messages, websocket)
-        new_script = extract_code_from_response(full_response)
-        logger.info("Generated fixed script")
+        await execute_analysis_script(script_path, workspace.root, websocket)
+    except Exception as e:
+        return str(e)
+    if not await aiofiles.os.path.exists(workspace.path(ANALYSIS_RESULTS_PATH)):
+        return f"The script finished without saving results to '{ANALYSIS_RESULTS_PATH}'"
+    return None
 
-        # Save and execute the new script
-        with open(ANALYSIS_SCRIPT_PATH, 'w') as f:
-            f.write(new_script)
+async def iterate_analysis_script(file_names: List[str], analysis_prompt: str, current_script: str, error_message: str, workspace: AnalysisWorkspace, websocket: WebSocket) -> tuple[str, Optional[str]]:
+    """
+    Iteratively improve the analysis script based on execution errors.
+    Returns a tuple of (new_script, error_message) where error_message is None if the new script succeeded.
+    """
+    logger.info("Starting script iteration with error: %s", error_message)
 
+    # The model fix is requested straight away; when a local fix applies it is tried while the
+    # request is in flight, and the request is cancelled if the local fix is enough
+    fix_task = asyncio.create_task(request_script_fix(file_names, analysis_prompt, current_script, error_message, workspace))
+    local_script = add_missing_import(current_script, error_message)
+    if local_script is not None:
+        logger.info("Trying the script with the missing import added")
         try:
-            await execute_analysis_script(ANALYSIS_SCRIPT_PATH, websocket)
-            if os.path.exists(ANALYSIS_RESULTS_PATH):
-                return new_script, True
-            else:
-                return new_script, False
-        except Exception as e:
-            return new_script, False
+            local_error = await run_analysis_candidate(local_script, workspace, websocket)
+        except BaseException:
+            fix_task.cancel()
+            raise
+        if local_error is None:
+            fix_task.cancel()
+            return local_script, None
 
+    try:
+        new_script = await fix_task
+        logger.info("Generated fixed script")
     except Exception as e:
         logger.error(f"Failed to generate fixed script: {str(e)}", exc_info=True)
-        return current_script, False
+        return current_script, error_message
+
+    return new_script, await run_analysis_candidate(new_script, workspace, websocket)
 
 # Execute the generated analysis script
-async def execute_analysis_script(script_path: str, websocket: WebSocket):
+async def execute_analysis_script(script_path: str, working_dir: str, websocket: WebSocket):
     """
-    Execute the generated analysis script.
+    Execute the generated analysis script from working_dir, where it finds its input and output directories.
     """
     logger.info(f"Starting execution of analysis script: {script_path}")
     try:
         logger.info("Running analysis script")
-        await websocket.send_json({"status": "Executing analysis script..."})
-        result = subprocess.run(['python', script_path], capture_output=True, text=True)
-        if result.returncode != 0:
-            error_msg = f"Script execution failed: {result.stderr}"
+        await send_json(websocket, {"status": "Executing analysis script..."})
+        # Byte-compile first so syntax errors surface without starting an interpreter
+        compiled_path = script_path + 'c'
+        try:
+            await asyncio.to_thread(py_compile.compile, script_path, cfile=compiled_path, doraise=True)
+        except py_compile.PyCompileError as e:
+            error_msg = f"Script execution failed: {e.msg}"
+            logger.error(error_msg)
+            await send_json(websocket, {"status": "Analysis script failed, attempting to fix..."})
+            raise Exception(error_msg)
+
+        # Run the script in a warm worker without blocking the event loop for other connections
+        success, stdout, stderr = await app.state.analysis_workers.run(compiled_path, working_dir)
+        if not success:
+            error_msg = f"Script execution failed: {stderr}"
             logger.error(error_msg)
-            await websocket.send_json({"status": "Analysis script failed, attempting to fix..."})
+            await send_json(websocket, {"status": "Analysis script failed, attempting to fix..."})
             raise Exception(error_msg)
         logger.info("Analysis script executed successfully")
-        await websocket.send_json({"status": "Analysis script executed successfully"})
-        return result.stdout
+        await send_json(websocket, {"status": "Analysis script executed successfully"})
+        return stdout
     except Exception as e:
         logger.error(f"Error executing analysis script: {str(e)}", exc_info=True)
         raise
@@ -532,34 +1137,92 @@ ANALYSIS_RESULTS_TEMPLATE = """
 }
 """
 
-async def generate_html_report(analysis_json_path: str, output_html_path: str, websocket: WebSocket):
+def trim_report_data(value: Any) -> Any:
+    """
+    Shrink analysis results for a prompt: lists and objects keep their first
+    REPORT_PROMPT_MAX_ITEMS entries and floats keep four significant digits.
+    """
+    if isinstance(value, dict):
+        return {
+            key: trim_report_data(item)
+            for key, item in itertools.islice(value.items(), REPORT_PROMPT_MAX_ITEMS)
+        }
+    if isinstance(value, list):
+        return [trim_report_data(item) for item in value[:REPORT_PROMPT_MAX_ITEMS]]
+    if isinstance(value, float):
+        return float(f"{value:.4g}")
+    return value
+
+report_templates = jinja2.Environment(
+    loader=jinja2.FileSystemLoader(TEMPLATES_DIR),
+    autoescape=True
+)
+
+def render_report_template(analysis_data: Dict[str, Any]) -> str:
+    """
+    Render the HTML report from the fixed template, with plot paths relative to the report.
     """
-    Generate an HTML report from the analysis results using OpenAI API.
+    visualizations = analysis_data.get('visualizations')
+    if not isinstance(visualizations, dict):
+        visualizations = {}
+    plots = [os.path.basename(plot) for plot in visualizations.get('plots') or []]
+    return report_templates.get_template('report.html.j2').render(
+        data=analysis_data,
+        plots=plots,
+        plot_descriptions={
+            os.path.basename(plot): description
+            for plot, description in (visualizations.get('plot_descriptions') or {}).items()
+        }
+    )
+
+async def generate_html_report(analysis_data: Dict[str, Any], output_html_path: str, websocket: WebSocket) -> str:
     """
-    logger.info(f"Starting HTML report generation from {analysis_json_path}")
+    Generate an HTML report from the parsed analysis results, with the OpenAI API or the fixed template.
+    Returns the HTML, which is also saved to output_html_path for the PDF renderer.
+    """
+    logger.info("Starting HTML report generation")
     try:
-        # Load analysis data from JSON file
-        logger.info("Loading analysis results from JSON")
-        
-        with open(analysis_json_path, 'r') as f:
-            analysis_data = json.load(f)
-        
-        # Remove 'output/' prefix from plot paths since HTML will be in the same directory
-        if 'visualizations' in analysis_data and 'plots' in analysis_data['visualizations']:
-            analysis_data['visualizations']['plots'] = [
-                plot.replace('output/', '') for plot in analysis_data['visualizations']['plots']
-            ]
+        if USE_REPORT_TEMPLATE:
+            # Fill the fixed report layout directly from the results, without a model call
+            html_content = await asyncio.to_thread(render_report_template, analysis_data)
+        else:
+            html_content = await write_html_report(analysis_data, websocket)
         
-        messages = [{
-            "role": "system",
-            "content": """You are an expert HTML/CSS developer and data analyst. Create a beautiful, modern HTML report about a data analysis using Tailwind CSS.
+        # Save the HTML report
+        async with aiofiles.open(output_html_path, 'w') as f:
+            await f.write(html_content)
+        logger.info(f"HTML report saved to {output_html_path}")
+        return html_content
+
+    except Exception as e:
+        logger.error(f"Failed to generate HTML report: {str(e)}")
+        raise
+
+async def write_html_report(analysis_data: Dict[str, Any], websocket: WebSocket) -> str:
+    """
+    Have the model write the HTML report for the analysis results.
+    """
+    # Remove 'output/' prefix from plot paths since HTML will be in the same directory.
+    # The caller's results are shared with other stages, so the change goes into copies.
+    if 'visualizations' in analysis_data and 'plots' in analysis_data['visualizations']:
+        analysis_data = {
+            **analysis_data,
+            'visualizations': {
+                **analysis_data['visualizations'],
+                'plots': [plot.replace('output/', '') for plot in analysis_data['visualizations']['plots']]
+            }
+        }
+    
+    messages = [{
+        "role": "system",
+        "content": """You are an expert HTML/CSS developer and data analyst. Create a beautiful, modern HTML report about a data analysis using Tailwind CSS.
 The HTML should be a single self-contained file with the Tailwind CDN included."""
-        }, {
-            "role": "user",
-            "content": f"""Create a clean and professional HTML report page that presents the analysis of the following data:
+    }, {
+        "role": "user",
+        "content": f"""Create a clean and professional HTML report page that presents the analysis of the following data:
 
 ANALYSIS DATA (use all relevant fields for the report):
-{json.dumps(analysis_data, indent=2)}
+{orjson.dumps(trim_report_data(analysis_data)).decode('utf-8')}
 
 REQUIREMENTS:
 
@@ -586,40 +1249,108 @@ REQUIREMENTS:
    - Clear typography and spacing
 
 Return only the complete HTML code with all required scripts, values and styles included."""
-        }]
+    }]
 
-        full_response = await stream_openai_response(messages, websocket)
-        html_content = extract_code_from_response(full_response, 'html')
-        
-        # Save the HTML report
-        with open(output_html_path, 'w') as f:
-            f.write(html_content)
-        logger.info(f"HTML report saved to {output_html_path}")
+    # The report is derived entirely from the analysis results, so identical results reuse it
+    full_response = await stream_openai_response(
+        messages, websocket, cache=True,
+        cache_check=lambda response: CODE_BLOCK_PATTERNS["html"].search(response) is not None
+    )
+    return extract_code_from_response(full_response, 'html')
 
+# Convert HTML to PDF. WeasyPrint is only imported inside the PDF worker processes,
+# so the server process never pays for loading it.
+# Fonts found by a PDF worker process, kept for every report it renders
+pdf_font_config: Optional[Any] = None
+
+def get_pdf_font_config() -> Any:
+    """
+    Return this worker's font configuration, creating it on first use.
+    """
+    global pdf_font_config
+    if pdf_font_config is None:
+        from weasyprint.text.fonts import FontConfiguration # type: ignore
+        pdf_font_config = FontConfiguration()
+    return pdf_font_config
+
+def warm_pdf_worker():
+    """
+    Render an empty document so a PDF worker has fonts and default styles loaded before its first report.
+    Runs as the pool initializer, so failures are logged rather than raised: a raising initializer breaks the pool.
+    """
+    try:
+        from weasyprint import HTML # type: ignore
+        HTML(string="<html><body></body></html>").write_pdf(font_config=get_pdf_font_config())
     except Exception as e:
-        logger.error(f"Failed to generate HTML report: {str(e)}")
-        raise
+        logger.warning(f"PDF worker warm-up failed: {str(e)}")
 
-# Convert HTML to PDF
-def generate_pdf_from_html(html_path: str, pdf_path: str, websocket: WebSocket):
+def render_pdf(html_path: str, pdf_path: str) -> bytes:
+    """
+    Render the HTML report to PDF, save it and return its bytes. Runs inside the PDF worker process pool.
+    """
+    from weasyprint import HTML # type: ignore
     try:
-        # Read the HTML content
-        with open(html_path, 'r', encoding='utf-8') as file:
-            html_content = file.read()
-        
-        # Get the absolute path of the output directory
-        abs_output_dir = os.path.abspath(OUTPUT_DIR)
-        
-        # Replace relative image paths with absolute file:// paths
-        html_content = html_content.replace('src="', f'src="file://{abs_output_dir}/')
-        
-        # Generate PDF using the modified HTML content
-        HTML(string=html_content).write_pdf(pdf_path)
+        # Loading from the file resolves the relative plot paths against the output directory
+        pdf_content = HTML(filename=html_path).write_pdf(font_config=get_pdf_font_config())
+        with open(pdf_path, 'wb') as f:
+            f.write(pdf_content)
         logger.info(f"Successfully generated PDF at {pdf_path}")
+        return pdf_content
     except Exception as e:
         logger.error(f"Failed to generate PDF: {str(e)}")
         raise
 
+async def generate_pdf_from_html(html_path: str, pdf_path: str, websocket: WebSocket) -> bytes:
+    """
+    Convert the HTML report to PDF in the worker process pool, returning the PDF bytes.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(app.state.pdf_pool, render_pdf, html_path, pdf_path)
+
+def encode_plot_image(output_dir: str, image_name: str) -> Optional[str]:
+    """
+    Read a plot from the output directory and return it base64 encoded, or None if it is missing.
+    """
+    full_path = os.path.join(output_dir, image_name)
+    try:
+        f = open(full_path, 'rb')
+    except FileNotFoundError:
+        return None
+    with f:
+        # Encode straight from the page cache instead of copying the file into a bytes object first
+        if os.fstat(f.fileno()).st_size == 0:
+            return ""
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as image_content:
+            return pybase64.b64encode_as_string(image_content)
+
+async def encode_plot_images(analysis_data: dict, output_dir: str) -> Dict[str, str]:
+    """
+    Read and encode all plots listed in the analysis results concurrently, keyed by file name.
+    """
+    visualizations = analysis_data.get('visualizations', {})
+    # A plot listed more than once is still read and encoded only once
+    image_names = list(dict.fromkeys(os.path.basename(plot_path) for plot_path in visualizations.get('plots', [])))
+    encoded_images = await asyncio.gather(
+        *(asyncio.to_thread(encode_plot_image, output_dir, image_name) for image_name in image_names)
+    )
+    return {
+        image_name: encoded
+        for image_name, encoded in zip(image_names, encoded_images)
+        if encoded is not None
+    }
+
+def inline_plot_images(html_content: str, image_data: Dict[str, str]) -> str:
+    """
+    Replace relative plot sources in the HTML with base64 data URIs in a single pass.
+    """
+    def replace_source(match: re.Match) -> str:
+        image_name = os.path.basename(match.group(1))
+        if image_name not in image_data:
+            return match.group(0)
+        return f'src="data:image/png;base64,{image_data[image_name]}"'
+
+    return IMAGE_SRC_PATTERN.sub(replace_source, html_content)
+
 async def generate_verbal_summary(analysis_data: dict, websocket: WebSocket) -> str:
     """
     Generate a verbal summary of the analysis results using OpenAI.
@@ -636,7 +1367,7 @@ Focus on the most important findings and insights. Use natural, conversational l
             "content": f"""Create a verbal summary of this data analysis that will be converted to speech:
 
 ANALYSIS DATA:
-{json.dumps(analysis_data, indent=2)}
+{orjson.dumps(trim_report_data(analysis_data)).decode('utf-8')}
 
 Requirements:
 1. Start with a brief introduction
@@ -649,13 +1380,13 @@ Requirements:
 The summary should flow naturally when spoken and avoid technical jargon unless necessary."""
         }]
 
-        await websocket.send_json({
+        await send_json(websocket, {
             "status": "Generating verbal summary of the analysis..."
         })
 
-        full_response = await stream_openai_response(
+        # Not streamed: it is generated while the report streams, and the client shows it as the transcript
+        full_response = await complete_openai_response(
             messages,
-            websocket,
             temperature=0.7,
             max_tokens=800
         )
@@ -673,25 +1404,22 @@ async def generate_speech(text: str, websocket: WebSocket) -> bytes:
     """
     logger.info("Converting summary to speech")
     try:
-        await websocket.send_json({
+        await send_json(websocket, {
             "status": "Converting summary to speech..."
         })
 
-        if not elevenlabs_client:
+        if not app.state.elevenlabs:
             raise Exception("ElevenLabs client not initialized - missing API key")
 
-        audio_stream = elevenlabs_client.text_to_speech.convert(
+        audio_stream = app.state.elevenlabs.text_to_speech.convert(
             text=text,
             voice_id=ELEVENLABS_VOICE_ID,
             model_id=ELEVENLABS_MODEL_ID,
             output_format=ELEVENLABS_OUTPUT_FORMAT
         )
-        
-        audio_bytes = b''
-        for chunk in audio_stream:
-            if isinstance(chunk, bytes):
-                audio_bytes += chunk
-        
+        audio_chunks = [chunk async for chunk in audio_stream if isinstance(chunk, bytes)]
+        audio_bytes = b''.join(audio_chunks)
+
         logger.info("Successfully generated speech audio")
         return audio_bytes
 
@@ -699,17 +1427,49 @@ async def generate_speech(text: str, websocket: WebSocket) -> bytes:
         logger.error(f"Failed to generate speech: {str(e)}")
         raise
 
+async def generate_spoken_summary(analysis_data: dict, websocket: WebSocket) -> tuple[str, bytes]:
+    """
+    Generate the verbal summary of the analysis and convert it to speech.
+    """
+    verbal_summary = await generate_verbal_summary(analysis_data, websocket)
+    return verbal_summary, await generate_speech(verbal_summary, websocket)
+
+async def send_report_files(report_files: List[tuple[str, str, bytes]], websocket: WebSocket):
+    """
+    Send report files as raw binary frames, in the order they were announced in the completion message.
+    Each file is split into REPORT_FRAME_SIZE frames so transfer starts without one huge message.
+    """
+    for _, _, data in report_files:
+        for offset in range(0, len(data), REPORT_FRAME_SIZE):
+            await websocket.send_bytes(data[offset:offset + REPORT_FRAME_SIZE])
+
+async def close_input_files(file_chunks: Dict[str, Dict[str, Any]]):
+    """
+    Close the input files of uploads that are complete or abandoned.
+    """
+    await asyncio.gather(*(file_info['file'].close() for file_info in file_chunks.values()))
+
 # WebSocket message handlers
-async def handle_analysis_start(data: Dict[str, Any], file_chunks: Dict[str, Dict[str, Any]], websocket: WebSocket):
+async def handle_analysis_start(data: Dict[str, Any], file_chunks: Dict[str, Dict[str, Any]], workspace: AnalysisWorkspace, websocket: WebSocket):
     """Handle the analysis_start message type."""
     file_names = data.get('fileNames', [])
     prompt = data.get('prompt', '')
     
+    # A new analysis replaces any upload that was never completed
+    await close_input_files(file_chunks)
+    file_chunks.clear()
+    
+    # Chunks are written straight to the input files as they arrive instead of being held in memory
     for file_name in file_names:
         file_chunks[file_name] = {
-            'chunks': [],
+            'file': await aiofiles.open(os.path.join(workspace.input_dir, file_name), 'wb'),
+            'next_chunk': 0,
+            'pending_chunks': {},
             'total_chunks': None,
-            'received_chunks': 0
+            'received_chunks': 0,
+            'received_bytes': 0,
+            # Content hash built as chunks are written, so the analysis cache key never re-reads the file
+            'digest': hashlib.sha256()
         }
     
     logger.info(f"Starting analysis for files: {file_names}")
@@ -720,21 +1480,46 @@ async def handle_file_chunk(data: Dict[str, Any], file_chunks: Dict[str, Dict[st
     file_name = data.get('fileName')
     chunk_index = data.get('chunkIndex')
     total_chunks = data.get('totalChunks')
-    content = data.get('content')
+    # The chunk itself follows the header as a binary frame; read it first so the stream stays in step even if the header is rejected
+    content = await websocket.receive_bytes()
     
     if file_name not in file_chunks:
         raise Exception(f"Received chunk for unknown file: {file_name}")
     
     file_info = file_chunks[file_name]
     if file_info['total_chunks'] is None:
+        if type(total_chunks) is not int or total_chunks < 1:
+            raise Exception(f"Invalid chunk count for {file_name}: {total_chunks!r}")
         file_info['total_chunks'] = total_chunks
-        file_info['chunks'] = [None] * total_chunks
     
-    file_info['chunks'][chunk_index] = content
+    # Only chunks that are still missing are accepted; a stale or duplicate index would never drain from the reorder buffer
+    if (
+        type(chunk_index) is not int
+        or not file_info['next_chunk'] <= chunk_index < file_info['total_chunks']
+        or chunk_index in file_info['pending_chunks']
+    ):
+        raise Exception(f"Invalid chunk index for {file_name}: {chunk_index!r}")
+    
+    # Bound what one connection can make the server hold, on disk and in the reorder buffer
+    uploaded_bytes = sum(info['received_bytes'] for info in file_chunks.values()) + len(content)
+    if uploaded_bytes > MAX_UPLOAD_BYTES:
+        raise Exception(f"Upload exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit")
+    pending_chunks = file_info['pending_chunks']
+    if chunk_index != file_info['next_chunk'] and len(pending_chunks) >= MAX_PENDING_CHUNKS:
+        raise Exception(f"Too many out-of-order chunks received for {file_name}")
+    file_info['received_bytes'] += len(content)
+    
+    # Hold chunks that arrive early until the ones before them have been written
+    pending_chunks[chunk_index] = content
+    while file_info['next_chunk'] in pending_chunks:
+        chunk = pending_chunks.pop(file_info['next_chunk'])
+        await file_info['file'].write(chunk)
+        file_info['digest'].update(chunk)
+        file_info['next_chunk'] += 1
     file_info['received_chunks'] += 1
     
     # Send acknowledgment
-    await websocket.send_json({
+    await send_json(websocket, {
         'type': 'chunk_received',
         'fileName': file_name,
         'chunkIndex': chunk_index
@@ -742,120 +1527,134 @@ async def handle_file_chunk(data: Dict[str, Any], file_chunks: Dict[str, Dict[st
     
     logger.info(f"Received chunk {chunk_index + 1}/{total_chunks} for {file_name}")
 
-async def handle_analysis_ready(file_chunks: Dict[str, Dict[str, Any]], prompt: str, websocket: WebSocket):
-    """Handle the analysis_ready message type."""
-    logger.info("All files received, starting analysis")
-    
-    # Save complete files
-    for file_name, file_info in file_chunks.items():
-        if file_info['received_chunks'] != file_info['total_chunks']:
-            raise Exception(f"Incomplete file received: {file_name}")
-        
-        complete_content = ''.join(file_info['chunks'])
-        file_path = os.path.join(INPUT_DIR, file_name)
-        
-        with open(file_path, 'w') as f:
-            f.write(complete_content)
-    
-    # Generate and save analysis code
+async def prepare_analysis_results(file_digests: Dict[str, bytes], prompt: str, workspace: AnalysisWorkspace, websocket: WebSocket) -> bool:
+    """
+    Generate (or reuse) the analysis script and run it until it writes the analysis results.
+    file_digests maps each uploaded file name to the sha256 digest of its content.
+    Returns False if the script could not be generated; the error has already been sent.
+    """
+    file_names = list(file_digests)
+    # Generate and save analysis code, reusing the working script from an identical earlier request
+    cache_key = analysis_cache_key(file_digests, prompt)
     try:
-        analysis_code = await generate_analysis_code(list(file_chunks.keys()), prompt, websocket)
-        with open(ANALYSIS_SCRIPT_PATH, 'w') as f:
-            f.write(analysis_code)
-        logger.info("Successfully generated and saved analysis code")
+        analysis_code = get_cached(analysis_code_cache, cache_key)
+        if analysis_code is not None:
+            logger.info("Reusing cached analysis code")
+            await send_json(websocket, {
+                "content": "♻️ These files and instructions were analyzed before, reusing the analysis code...\n\n"
+            })
+        else:
+            analysis_code = await generate_analysis_code(file_names, prompt, workspace, websocket)
+        logger.info("Successfully generated analysis code")
     except Exception as e:
         logger.error(f"Error generating analysis code: {str(e)}")
-        await websocket.send_json({"error": f"Error generating analysis code: {str(e)}"})
-        return
+        await send_json(websocket, {"error": f"Error generating analysis code: {str(e)}"})
+        return False
     
-    # Execute the analysis script with retries
-    current_retry = 0
+    # Results left over from an earlier analysis must not count as this script's output
+    try:
+        await aiofiles.os.remove(workspace.path(ANALYSIS_RESULTS_PATH))
+    except FileNotFoundError:
+        pass
+
+    # Execute the analysis script, then let each fix attempt run its own candidate so no script runs twice
     current_script = analysis_code
-    success = False
+    error_message = await run_analysis_candidate(current_script, workspace, websocket)
 
-    while current_retry < MAX_RETRIES and not success:
-        try:
-            await execute_analysis_script(ANALYSIS_SCRIPT_PATH, websocket)
-            if os.path.exists(ANALYSIS_RESULTS_PATH):
-                success = True
-                break
-        except Exception as e:
-            error_message = str(e)
-            logger.error(f"Analysis script failed (attempt {current_retry + 1}/{MAX_RETRIES}): {error_message}")
-            await websocket.send_json({"status": "Improving analysis..."})
-            
-            current_script, success = await iterate_analysis_script(
-                list(file_chunks.keys()),
-                prompt,
-                current_script,
-                error_message,
-                websocket
-            )
-            if success:
-                break
-            current_retry += 1
+    for current_retry in range(MAX_RETRIES):
+        if error_message is None:
+            break
+        logger.error(f"Analysis script failed (attempt {current_retry + 1}/{MAX_RETRIES}): {error_message}")
+        await send_json(websocket, {"status": "Improving analysis..."})
+        
+        current_script, error_message = await iterate_analysis_script(
+            file_names,
+            prompt,
+            current_script,
+            error_message,
+            workspace,
+            websocket
+        )
 
-    if not success:
+    if error_message is not None:
         raise Exception("Failed to execute analysis script after maximum retries")
+    set_cached(analysis_code_cache, cache_key, current_script)
+    return True
 
-    # Generate reports and summaries
-    if not os.path.exists(ANALYSIS_RESULTS_PATH):
-        logger.error("Analysis results JSON not found")
-        return
-    
-    await websocket.send_json({"status": "Generating report..."})
-    await generate_html_report(ANALYSIS_RESULTS_PATH, REPORT_HTML_PATH, websocket)
+async def build_report_files(analysis_data: Dict[str, Any], workspace: AnalysisWorkspace, websocket: WebSocket) -> List[tuple[str, str, bytes]]:
+    """
+    Generate the HTML and PDF reports, returning them as (name, media type, data) entries.
+    The plots are inlined into the HTML, which is the only place the client gets them from.
+    """
+    await send_json(websocket, {"status": "Generating report..."})
+    report_html_path = workspace.path(REPORT_HTML_PATH)
+    html_content, image_data = await asyncio.gather(
+        generate_html_report(analysis_data, report_html_path, websocket),
+        encode_plot_images(analysis_data, workspace.output_dir)
+    )
     
     # Convert HTML to PDF
-    generate_pdf_from_html(REPORT_HTML_PATH, REPORT_PDF_PATH, websocket)
+    pdf_content = await generate_pdf_from_html(report_html_path, workspace.path(REPORT_PDF_PATH), websocket)
     
-    # Read file contents
-    with open(REPORT_HTML_PATH, 'r', encoding='utf-8') as f:
-        html_content = f.read()
-    with open(REPORT_PDF_PATH, 'rb') as f:
-        pdf_content = f.read()
+    # Modify HTML content to use base64 encoded images
+    html_content = inline_plot_images(html_content, image_data)
     
-    # Read analysis data and encode images
-    with open(ANALYSIS_RESULTS_PATH, 'r') as f:
-        analysis_data = json.load(f)
+    return [
+        ("report.html", "text/html", html_content.encode('utf-8')),
+        ("report.pdf", "application/pdf", pdf_content)
+    ]
+
+async def handle_analysis_ready(file_chunks: Dict[str, Dict[str, Any]], prompt: str, workspace: AnalysisWorkspace, websocket: WebSocket):
+    """Handle the analysis_ready message type."""
+    logger.info("All files received, starting analysis")
     
-    image_data = {}
-    visualizations = analysis_data.get('visualizations', {})
-    for plot_path in visualizations.get('plots', []):
-        full_path = os.path.join(OUTPUT_DIR, os.path.basename(plot_path))
-        if os.path.exists(full_path):
-            with open(full_path, 'rb') as f:
-                image_content = f.read()
-                image_data[os.path.basename(plot_path)] = base64.b64encode(image_content).decode('utf-8')
+    # Finish writing the uploaded files
+    for file_name, file_info in file_chunks.items():
+        if file_info['received_chunks'] != file_info['total_chunks'] or file_info['next_chunk'] != file_info['total_chunks']:
+            raise Exception(f"Incomplete file received: {file_name}")
     
-    # Modify HTML content to use base64 encoded images
-    for image_name, image_content in image_data.items():
-        html_content = html_content.replace(
-            f'src="{image_name}"',
-            f'src="data:image/png;base64,{image_content}"'
-        )
+    await close_input_files(file_chunks)
+    file_digests = {file_name: file_info['digest'].digest() for file_name, file_info in file_chunks.items()}
+    file_chunks.clear()
+
+    if not await prepare_analysis_results(file_digests, prompt, workspace, websocket):
+        return
+
+    # Parse the results once, off the event loop; report generation, plot encoding and the summary all share them
+    async with aiofiles.open(workspace.path(ANALYSIS_RESULTS_PATH), 'rb') as f:
+        analysis_data = await asyncio.to_thread(load_json, await f.read())
     
-    # Generate verbal summary and speech
+    # The spoken summary only needs the results, so it is produced while the reports are built
+    summary_task = asyncio.create_task(generate_spoken_summary(analysis_data, websocket))
     try:
-        verbal_summary = await generate_verbal_summary(analysis_data, websocket)
-        audio_content = await generate_speech(verbal_summary, websocket)
-        audio_base64 = base64.b64encode(audio_content).decode('utf-8')
+        report_files = await build_report_files(analysis_data, workspace, websocket)
+    except BaseException:
+        summary_task.cancel()
+        raise
+    
+    try:
+        verbal_summary, audio_content = await summary_task
+        report_files.append(("summary.mp3", "audio/mpeg", audio_content))
     except Exception as e:
         logger.error(f"Failed to generate speech content: {str(e)}")
-        audio_base64 = None
-        await websocket.send_json({
+        verbal_summary = None
+        await send_json(websocket, {
             "content": f"⚠️ Could not generate speech: {str(e)}\n\n"
         })
     
-    # Send completion message with all content
-    await websocket.send_json({
+    # Send completion message, followed by the report files as binary frames
+    manifest = {
         "status": "completed",
-        "html_content": html_content,
-        "pdf_content": base64.b64encode(pdf_content).decode('utf-8'),
-        "image_data": image_data,
-        "audio_content": audio_base64,
-        "verbal_summary": verbal_summary if audio_base64 else None
-    })
+        "files": [
+            {"name": name, "type": media_type, "size": len(data)}
+            for name, media_type, data in report_files
+        ],
+        "verbal_summary": verbal_summary
+    }
+    # Drop the reference to the parsed results before the slow part of the send
+    del analysis_data
+    await send_json(websocket, manifest)
+    await send_report_files(report_files, websocket)
 
 # WebSocket endpoint for data analysis
 @app.websocket("/ws/analyze")
@@ -866,6 +1665,7 @@ async def analyze_data(websocket: WebSocket):
     
     file_chunks = {}
     prompt = ""
+    workspace = await asyncio.to_thread(AnalysisWorkspace)
     
     try:
         while True:
@@ -874,11 +1674,11 @@ async def analyze_data(websocket: WebSocket):
                 message_type = data.get('type', '')
                 
                 if message_type == 'analysis_start':
-                    _, prompt = await handle_analysis_start(data, file_chunks, websocket)
+                    _, prompt = await handle_analysis_start(data, file_chunks, workspace, websocket)
                 elif message_type == 'file_chunk':
                     await handle_file_chunk(data, file_chunks, websocket)
                 elif message_type == 'analysis_ready':
-                    await handle_analysis_ready(file_chunks, prompt, websocket)
+                    await handle_analysis_ready(file_chunks, prompt, workspace, websocket)
                     file_chunks.clear()
                 
             except WebSocketDisconnect:
@@ -887,10 +1687,14 @@ async def analyze_data(websocket: WebSocket):
                 break
             except Exception as e:
                 logger.error(f"Error in analyze_data: {str(e)}", exc_info=True)
-                await websocket.send_json({"error": str(e)})
+                await send_json(websocket, {"error": str(e)})
     except Exception as e:
         logger.error(f"Fatal error in analyze_data: {str(e)}", exc_info=True)
         manager.disconnect(websocket)
+    finally:
+        # Don't leave partially uploaded files open after the client goes away
+        await close_input_files(file_chunks)
+        await asyncio.to_thread(workspace.remove)
 
 # Run the app with uvicorn if this script is executed directly
 if __name__ == "__main__":
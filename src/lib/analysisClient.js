@@ -5,12 +5,15 @@ export class AnalysisClient {
 		this.reconnectAttempts = 0;
 		this.maxReconnectAttempts = 5;
 		this.reconnectDelay = 1000; // Start with 1 second
+		this.pendingReport = null;
 	}
 
 	connect() {
 		if (this.ws?.readyState === WebSocket.OPEN) return;
 
 		this.ws = new WebSocket('ws://localhost:8000/ws/analyze');
+		// Report files arrive as raw binary frames after the completion message
+		this.ws.binaryType = 'arraybuffer';
 
 		this.ws.onopen = () => {
 			this.isConnected = true;
@@ -99,6 +102,11 @@ export class AnalysisClient {
 
 			// Set up message handling
 			this.ws.onmessage = (event) => {
+				if (event.data instanceof ArrayBuffer) {
+					this.receiveReportData(event.data, callbacks);
+					return;
+				}
+
 				const response = JSON.parse(event.data);
 
 				if (response.type === 'chunk_received') {
@@ -108,17 +116,16 @@ export class AnalysisClient {
 
 				if (response.error) {
 					callbacks.onError?.(response.error);
+				} else if (response.status === 'completed') {
+					// Wait for the announced files before reporting completion
+					this.pendingReport = {
+						response,
+						files: response.files.map((file) => ({ ...file, parts: [], received: 0 })),
+						index: 0
+					};
+					this.finishReportFiles(callbacks);
 				} else if (response.status) {
 					callbacks.onStatus?.(response.status);
-					if (response.status === 'completed') {
-						callbacks.onComplete?.({
-							htmlContent: response.html_content,
-							pdfContent: response.pdf_content,
-							imageData: response.image_data,
-							audioContent: response.audio_content,
-							verbalSummary: response.verbal_summary
-						});
-					}
 				} else if (response.content) {
 					callbacks.onContent?.(response.content);
 				}
@@ -129,6 +136,38 @@ export class AnalysisClient {
 		}
 	}
 
+	receiveReportData(data, callbacks) {
+		if (!this.pendingReport) return;
+
+		const file = this.pendingReport.files[this.pendingReport.index];
+		file.parts.push(data);
+		file.received += data.byteLength;
+		this.finishReportFiles(callbacks);
+	}
+
+	finishReportFiles(callbacks) {
+		const report = this.pendingReport;
+		while (
+			report.index < report.files.length &&
+			report.files[report.index].received >= report.files[report.index].size
+		) {
+			report.index++;
+		}
+		if (report.index < report.files.length) return;
+
+		this.pendingReport = null;
+		const blobs = Object.fromEntries(
+			report.files.map((file) => [file.name, new Blob(file.parts, { type: file.type })])
+		);
+		callbacks.onStatus?.('completed');
+		callbacks.onComplete?.({
+			htmlContent: blobs['report.html'],
+			pdfContent: blobs['report.pdf'],
+			audioContent: blobs['summary.mp3'] ?? null,
+			verbalSummary: report.response.verbal_summary
+		});
+	}
+
 	async readFileContent(file) {
 		return new Promise((resolve, reject) => {
 			const reader = new FileReader();
@@ -160,34 +199,22 @@ export class AnalysisClient {
 			const end = Math.min(start + CHUNK_SIZE, file.size);
 			const chunk = file.slice(start, end);
 
-			const chunkContent = await new Promise((resolve, reject) => {
-				const reader = new FileReader();
-				reader.onload = (e) => resolve(e.target.result);
-				reader.onerror = reject;
-
-				if (file.name.endsWith('.csv') || file.name.endsWith('.txt')) {
-					reader.readAsText(chunk);
-				} else if (file.name.endsWith('.xlsx')) {
-					reader.readAsBinaryString(chunk);
-				} else {
-					reader.readAsText(chunk);
-				}
-			});
-
+			// The header goes as JSON and the raw bytes follow as a binary frame
 			const message = {
 				type: 'file_chunk',
 				fileName: file.name,
 				chunkIndex,
 				totalChunks,
-				content: chunkContent,
 				isLastChunk: chunkIndex === totalChunks - 1
 			};
 
 			this.ws.send(JSON.stringify(message));
+			this.ws.send(await chunk.arrayBuffer());
 
 			// Wait for server acknowledgment before sending next chunk
 			await new Promise((resolve) => {
 				const handler = (event) => {
+					if (typeof event.data !== 'string') return;
 					const response = JSON.parse(event.data);
 					if (
 						response.type === 'chunk_received' &&